@@ -1,13 +1,63 @@
-from flask import Flask, render_template, request, redirect, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, session, flash, jsonify, g
+from flask.json.provider import DefaultJSONProvider
+from flask_caching import Cache
+from flask_session import Session
+from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
-import json
+import fcntl
+import hmac
+import math
+import msgpack
+import orjson
 import os
 import random
+import re
+import redis
+import secrets
+import threading
+import time
+from urllib.parse import quote
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Routes Flask's JSON handling (jsonify, request.get_json) through orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.secret_key = "secure_banking_key"
-
-DB_FILE = "banking_data.json"
+app.config["CACHE_TYPE"] = "SimpleCache"
+app.config["CACHE_DEFAULT_TIMEOUT"] = 30
+app.config["TEMPLATES_AUTO_RELOAD"] = False
+cache = Cache(app)
+
+# Keep sessions server side when Redis is available; the cookie then only
+# carries the session id instead of the signed session contents.
+if os.environ.get("REDIS_URL"):
+    app.config["SESSION_TYPE"] = "redis"
+    app.config["SESSION_REDIS"] = redis.from_url(os.environ["REDIS_URL"])
+    Session(app)
+
+DB_FILE = "banking_data.msgpack"
+JSON_DB_FILE = "banking_data.json"  # Snapshot format before msgpack
+LOG_FILE = "txn_log.jsonl"
+LOCK_FILE = "banking_data.lock"  # Held by the one process that writes the database
+# A gunicorn reload starts the new worker before the old one has exited, so
+# wait this many seconds for the old worker to release LOCK_FILE. It stays
+# under gunicorn's 30 second worker timeout; the Procfile's graceful timeout
+# keeps the old worker's shutdown shorter still.
+LOCK_TIMEOUT = 25
+HISTORY_DIR = "histories"  # One append-only <username>.jsonl per customer
+DB_VERSION = 3
+
+# A background thread folds the log into a new DB_FILE snapshot once this
+# many changes are pending, or every SNAPSHOT_INTERVAL seconds otherwise
+SNAPSHOT_EVERY = 100
+SNAPSHOT_INTERVAL = 60
 
 # --- CONFIGURATION: SPENDING LIMITS ---
 TIER_LIMITS = {
@@ -16,54 +66,483 @@ TIER_LIMITS = {
     "Tier 3": 9000000000000     # 9 Trillion
 }
 
+# orjson and msgpack store integers of at most 64 bits, so amounts and the
+# balances they add up to must stay below this
+AMOUNT_LIMIT = 2 ** 63
+
+# --- CONFIGURATION: USERNAMES ---
+USERNAME_RE = re.compile(r"[a-z0-9_.]{3,30}")
+
+# --- CONFIGURATION: BILL DESCRIPTIONS ---
+# bill_type: (provider field, provider default, number field, description)
+BILL_FIELDS = {
+    "Airtime": ("network", "Mobile", "phone_number", "Airtime: {} {}"),
+    "Data": ("network", "Mobile", "phone_number", "Data: {} {}"),
+    "Electricity": ("disco", "Power", "meter_number", "Power: {} ({})"),
+    "Cable": ("cable_provider", "Cable", "smartcard", "Cable: {} ({})"),
+    "Betting": ("bet_platform", "Bet", "bet_id", "Betting: {} ({})"),
+}
+
+# The live database. It is loaded once per process and kept in memory, so the
+# app must be served by a single worker process (threads are fine).
+_DB = {"data": None, "lock": None, "log": None, "seq": 0, "snapshot_seq": 0, "accounts": {}, "refs": {}, "versions": {}, "unsaved": []}
+_DB_LOCK = threading.RLock()
+# Held by save_data so only one snapshot is written at a time. Always take
+# it before _DB_LOCK, never while holding _DB_LOCK.
+_SAVE_LOCK = threading.Lock()
+_SNAPSHOT_DUE = threading.Event()
+
+# (minute since the epoch, date string, timestamp string), swapped as a whole
+_CLOCK = [(None, None, None)]
+
+# Record fields kept in memory only; snapshots leave them out
+_HISTORY_FIELDS = ("transactions", "total_in", "total_out")
+
 # --- HELPER FUNCTIONS ---
 
-def load_data():
-    """Reads the database file."""
-    if not os.path.exists(DB_FILE):
-        return {}
+def _read_json_snapshot():
+    """Reads a database saved as JSON_DB_FILE by older versions."""
     try:
-        with open(DB_FILE, 'r') as file:
-            return json.load(file)
-    except (json.JSONDecodeError, IOError):
+        with open(JSON_DB_FILE, 'rb') as file:
+            return orjson.loads(file.read())
+    except (orjson.JSONDecodeError, IOError):
         return {}
 
+def _read_snapshot():
+    """Reads DB_FILE, returning (seq, customers)."""
+    try:
+        with open(DB_FILE, 'rb') as file:
+            data = msgpack.unpackb(file.read(), raw=False)
+    except FileNotFoundError:
+        data = _read_json_snapshot()
+    except (ValueError, msgpack.UnpackException, IOError):
+        return 0, {}
+    # Databases written before the transaction log are a bare customers dict
+    if not isinstance(data.get("seq"), int):
+        data = {"seq": 0, "customers": data}
+    if data.get("version", 1) < 2:
+        # Version 1 stored each history newest first
+        for user in data["customers"].values():
+            user["transactions"].reverse()
+    return data["seq"], data["customers"]
+
+def _history_path(username):
+    """Returns the path of a customer's history file."""
+    return os.path.join(HISTORY_DIR, quote(username, safe="") + ".jsonl")
+
+def _read_history(username, repair=True):
+    """Reads a customer's transactions, dropping a torn last line."""
+    path = _history_path(username)
+    try:
+        with open(path, 'rb') as file:
+            raw = file.read()
+    except FileNotFoundError:
+        return []
+    end = raw.rfind(b"\n") + 1
+    if end < len(raw) and repair:
+        # Cut short by a crash mid-snapshot; the log still has the entry
+        with open(path, 'r+b') as file:
+            file.truncate(end)
+    txns = {}
+    for line in raw[:end].splitlines():
+        txn = orjson.loads(line)
+        # A snapshot that failed part way may have appended it already
+        txns.setdefault(txn["ref"], txn)
+    return list(txns.values())
+
+def _append(file, data):
+    """Writes data to the end of an unbuffered file, cutting the file back
+    to its old size if the write fails part way."""
+    start = os.fstat(file.fileno()).st_size
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[file.write(view):]
+    except BaseException:
+        # Left in place, the partial line would sit between later entries
+        file.truncate(start)
+        raise
+
+def _write_history(username, txns, mode='ab'):
+    """Writes transactions to a customer's history file and syncs it.
+
+    A failed write or sync leaves the file as it was, so a retry cannot
+    append after a partial line.
+    """
+    with open(_history_path(username), mode, buffering=0) as file:
+        start = os.fstat(file.fileno()).st_size
+        _append(file, b"".join(orjson.dumps(txn) + b"\n" for txn in txns))
+        try:
+            os.fsync(file.fileno())
+        except BaseException:
+            file.truncate(start)
+            raise
+
+def _fsync_dir(path):
+    """Syncs a directory, so files created or renamed in it survive a crash."""
+    dir_fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+def _read_log():
+    """Yields the complete entries of LOG_FILE in order."""
+    try:
+        with open(LOG_FILE, 'rb') as file:
+            for number, line in enumerate(file, 1):
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    if next(file, None) is not None:
+                        raise ValueError(f"{LOG_FILE} line {number} is corrupt "
+                                         "and entries follow it") from None
+                    # A torn last line from a crash mid-write
+                    return
+                yield entry
+    except FileNotFoundError:
+        return
+
+def _apply(data, changes):
+    """Applies one logged change set to the customers dict."""
+    for username, fields in changes.items():
+        fields = dict(fields)
+        txn = fields.pop("txn", None)
+        user = data.setdefault(username, {})
+        user.update(fields)
+        _DB["versions"][username] = _DB["versions"].get(username, 0) + 1
+        if "account_no" in fields:
+            _DB["accounts"][fields["account_no"]] = username
+        if txn:
+            add_transaction(username, txn)
+
+def _lock_db():
+    """Takes LOCK_FILE for this process, failing if another one still holds
+    it after LOCK_TIMEOUT seconds."""
+    lock = open(LOCK_FILE, 'ab')
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                lock.close()
+                raise RuntimeError(f"{LOCK_FILE} is held by another process; "
+                                   "only one process may serve the database") from None
+            time.sleep(0.1)
+
+def load_data(read_only=False):
+    """Returns the live database, loading it on first use.
+
+    A read-only load leaves every file as it is and takes no lock, so it can
+    look at the database while a server has it open.
+    """
+    if _DB["data"] is not None:
+        return _DB["data"]
+    with _DB_LOCK:
+        if _DB["data"] is not None:
+            return _DB["data"]
+        if not read_only and _DB["lock"] is None:
+            # Kept after a failed load, so a retry does not lock against itself
+            _DB["lock"] = _lock_db()
+        seq, data = _read_snapshot()
+        if not read_only:
+            os.makedirs(HISTORY_DIR, exist_ok=True)
+        migrated = False
+        for username, user in data.items():
+            if "transactions" in user:
+                # Snapshots before version 3 kept the histories inline
+                if not read_only:
+                    _write_history(username, user["transactions"], 'wb')
+                    migrated = True
+            else:
+                user["transactions"] = _read_history(username, repair=not read_only)
+            txns = user["transactions"]
+            user["total_in"] = sum(t["amount"] for t in txns if t["type"] == "Credit")
+            user["total_out"] = sum(t["amount"] for t in txns if t["type"] == "Debit")
+        if migrated:
+            _fsync_dir(HISTORY_DIR)
+        _DB["accounts"] = {user["account_no"]: username for username, user in data.items()}
+        _DB["refs"] = {
+            username: {t["ref"]: t for t in user["transactions"]}
+            for username, user in data.items()
+        }
+        _DB["data"] = data
+        _DB["seq"] = _DB["snapshot_seq"] = seq
+        for entry in _read_log():
+            if entry["seq"] > _DB["seq"]:
+                _apply(data, entry["changes"])
+                _DB["seq"] = entry["seq"]
+        if read_only:
+            return data
+        # Unbuffered, so every entry reaches the file in a single write
+        _DB["log"] = open(LOG_FILE, 'ab', buffering=0)
+        compact = migrated or not os.path.exists(DB_FILE) or _DB["log"].tell()
+    # Outside _DB_LOCK, since save_data takes _SAVE_LOCK before it
+    if compact:
+        # Fold an older database or the replayed entries (and any torn
+        # tail) into a new snapshot
+        save_data(data)
+    threading.Thread(target=_snapshot_worker, daemon=True).start()
+    return data
+
 def save_data(data):
-    """Writes data to file."""
-    with open(DB_FILE, 'w') as file:
-        json.dump(data, file, indent=4)
+    """Writes new transactions to the histories and a snapshot of the
+    records to DB_FILE, then drops the folded entries from the log.
+
+    Only taking the cut holds the database lock; requests keep logging
+    changes while the files are written and synced.
+    """
+    with _SAVE_LOCK:
+        with _DB_LOCK:
+            seq = _DB["seq"]
+            # Log bytes past this offset were written after the cut
+            offset = os.fstat(_DB["log"].fileno()).st_size
+            pending = _DB["unsaved"]
+            _DB["unsaved"] = []
+            records = {
+                username: {k: v for k, v in user.items() if k not in _HISTORY_FIELDS}
+                for username, user in data.items()
+            }
+        try:
+            unsaved = {}
+            for username, txn in pending:
+                unsaved.setdefault(username, []).append(txn)
+            created = False
+            for username, txns in unsaved.items():
+                created = created or not os.path.exists(_history_path(username))
+                _write_history(username, txns)
+            if created:
+                # New history files must be on disk before the log is emptied
+                _fsync_dir(HISTORY_DIR)
+            payload = msgpack.packb({"version": DB_VERSION, "seq": seq, "customers": records}, use_bin_type=True)
+            # Write beside the snapshot and swap it in, so a crash mid-write
+            # leaves the previous snapshot intact.
+            tmp_file = DB_FILE + ".tmp"
+            with open(tmp_file, 'wb') as file:
+                file.write(payload)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_file, DB_FILE)
+            # The rename must be on disk before the log it replaces is emptied
+            _fsync_dir(os.path.dirname(os.path.abspath(DB_FILE)))
+        except Exception:
+            # Keep the transactions for the next try; any already appended
+            # are dropped again as duplicates when the histories are read.
+            with _DB_LOCK:
+                _DB["unsaved"] = pending + _DB["unsaved"]
+            raise
+        with _DB_LOCK:
+            # Entries up to seq are now in the snapshot and skipped on replay,
+            # so a crash before the swap cannot apply them twice.
+            with open(LOG_FILE, 'rb') as file:
+                file.seek(offset)
+                tail = file.read()
+            tmp_file = LOG_FILE + ".tmp"
+            with open(tmp_file, 'wb') as file:
+                file.write(tail)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_file, LOG_FILE)
+            _DB["log"].close()
+            _DB["log"] = open(LOG_FILE, 'ab', buffering=0)
+            _DB["snapshot_seq"] = seq
+
+def record(op, changes):
+    """Applies a change set and appends it to the transaction log.
+
+    ``changes`` maps usernames to the fields to set on their record; a
+    ``"txn"`` field is added to the user's transactions instead.
+    """
+    with _DB_LOCK:
+        seq = _DB["seq"] + 1
+        entry = {"seq": seq, "op": op, "ts": datetime.now().isoformat(), "changes": changes}
+        _append(_DB["log"], orjson.dumps(entry) + b"\n")
+        _apply(_DB["data"], changes)
+        _DB["seq"] = seq
+        if seq - _DB["snapshot_seq"] >= SNAPSHOT_EVERY:
+            _SNAPSHOT_DUE.set()
+
+def _snapshot_worker():
+    """Keeps folding the transaction log into new snapshots."""
+    while True:
+        _SNAPSHOT_DUE.wait(SNAPSHOT_INTERVAL)
+        _SNAPSHOT_DUE.clear()
+        try:
+            if _DB["seq"] > _DB["snapshot_seq"]:
+                save_data(_DB["data"])
+        except Exception:
+            # The log still holds every change, so try again next round
+            app.logger.exception("Snapshot failed")
+
+def add_transaction(username, txn):
+    """Adds a transaction to the user's history, which is kept oldest first."""
+    refs = _DB["refs"].setdefault(username, {})
+    if txn["ref"] in refs:
+        # Already in the history file; the log is being replayed after a
+        # crash between writing the histories and emptying the log
+        return
+    user = _DB["data"][username]
+    user["transactions"].append(txn)
+    total = "total_in" if txn["type"] == "Credit" else "total_out"
+    user[total] = user.get(total, 0) + txn["amount"]
+    refs[txn["ref"]] = txn
+    _DB["unsaved"].append((username, txn))
+
+def find_transaction(username, ref):
+    """Returns the user's transaction with the given reference, or None."""
+    return _DB["refs"].get(username, {}).get(ref)
+
+def load_user(username):
+    """Returns a single customer record, or None."""
+    return load_data().get(username)
+
+def find_account(account_no):
+    """Returns (username, user) for an account number, or (None, None)."""
+    load_data()
+    username = _DB["accounts"].get(account_no)
+    user = load_user(username)
+    if not user:
+        return None, None
+    return username, user
+
+def _clock():
+    """Returns (date, time) strings, formatted at most once a minute."""
+    minute = int(time.time() // 60)
+    if _CLOCK[0][0] != minute:
+        # Both formats stop at minutes, so they hold for the whole minute
+        now = datetime.now()
+        _CLOCK[0] = (minute, now.strftime("%Y-%m-%d"), now.strftime('%d-%m-%Y %H:%M'))
+    return _CLOCK[0]
+
+def _request_time():
+    """Pins the clock strings for the rest of the request."""
+    if "clock" not in g:
+        g.clock = _clock()
+    return g.clock
+
+def today():
+    """Returns the request date, as stored in last_txn_date."""
+    return _request_time()[1]
+
+def timestamp():
+    """Returns the request time, as shown on transactions."""
+    return _request_time()[2]
+
+def is_pin_hash(pin):
+    """Tells hashed PINs apart from the plaintext ones older versions saved."""
+    return pin.startswith(("scrypt:", "pbkdf2:"))
+
+def check_pin(user, pin):
+    """Checks a PIN against the user's stored PIN."""
+    if is_pin_hash(user["pin"]):
+        return check_password_hash(user["pin"], pin)
+    return hmac.compare_digest(user["pin"].encode(), pin.encode())
+
+def generate_account_no():
+    """Generates a realistic account number that is not already in use."""
+    while True:
+        account_no = str(random.randint(2000000000, 2999999999))
+        if account_no not in _DB["accounts"]:
+            return account_no
+
+def parse_amount(value, parse=float):
+    """Parses a form amount, rejecting nan, infinity and amounts too large
+    to store.
+
+    Nan and infinity pass every balance check and would be logged as null.
+    """
+    amount = parse(value)
+    if not math.isfinite(amount) or abs(amount) >= AMOUNT_LIMIT:
+        raise ValueError(f"amount out of range: {value!r}")
+    return amount
+
+def make_txn(desc, type_, amount, ref):
+    """Builds a successful transaction record stamped with the request time."""
+    return {
+        "date": timestamp(),
+        "desc": desc,
+        "type": type_,
+        "amount": amount,
+        "ref": ref,
+        "status": "Success"
+    }
+
+def generate_ref(*usernames):
+    """Generates a transaction reference unused by any of the given users."""
+    while True:
+        ref = f"REF{secrets.token_hex(5).upper()}"
+        if not any(find_transaction(username, ref) for username in usernames):
+            return ref
+
+def tier_limit(user):
+    """Returns the daily spending limit for the user's tier."""
+    return TIER_LIMITS.get(user.get("tier", "Tier 1"), 9000000)
 
-def generate_ref():
-    """Generates a unique transaction reference."""
-    return f"REF{random.randint(1000000000, 9999999999)}"
+def compute_progress(daily_used, limit):
+    """Returns how much of the daily limit is used, as a percentage."""
+    return min((daily_used / limit) * 100, 100) if limit > 0 else 0
 
 def check_daily_limit(user, amount):
     """Resets daily limit if date changed, checks if amount allowed."""
-    today_str = datetime.now().strftime("%Y-%m-%d")
+    today_str = today()
     
     # Reset if it's a new day
     if user.get("last_txn_date") != today_str:
         user["daily_used"] = 0
         user["last_txn_date"] = today_str
     
-    tier = user.get("tier", "Tier 1")
-    limit = TIER_LIMITS.get(tier, 9000000)
+    limit = tier_limit(user)
     
     if (user.get("daily_used", 0) + amount) > limit:
         return False, limit
     
     return True, limit
 
+def _page_cache_key(*args, **kwargs):
+    """Keys a cached page by user, path and the user's change count."""
+    username = session["user"]
+    load_data()
+    return f"page:{username}:{_DB['versions'].get(username, 0)}:{request.path}"
+
+def cached_page(view):
+    """Caches a read-only page until the logged in user's record changes."""
+    return cache.cached(make_cache_key=_page_cache_key, unless=lambda: "user" not in session)(view)
+
+@app.after_request
+def set_browser_cache(response):
+    """Lets the browser reuse the cards page, which only shows fixed details."""
+    if request.endpoint == "cards" and response.status_code == 200:
+        response.headers["Cache-Control"] = "private, max-age=5"
+    return response
+
+# Compile every template up front rather than on the first request for each
+for template_name in app.jinja_env.list_templates():
+    app.jinja_env.get_template(template_name)
+
+def serve():
+    """Loads the database for writing and returns the app, for gunicorn.
+
+    Loading at startup spares the first request; the flask CLI imports the
+    app without loading it, so its commands never write under a server.
+    """
+    load_data()
+    return app
+
 # --- PAGE ROUTES ---
 
 @app.route("/", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
-        username = request.form["username"].lower().strip()
-        pin = request.form["pin"]
-        customers = load_data()
-
-        if username in customers and customers[username]["pin"] == pin:
+        form = request.form
+        username = form["username"].strip().lower()
+        pin = form["pin"]
+        user = load_user(username)
+
+        if user and check_pin(user, pin):
+            if not is_pin_hash(user["pin"]):
+                record("hash_pin", {username: {"pin": generate_password_hash(pin)}})
             session["user"] = username
             session["last_login"] = datetime.now().strftime("%d %b %Y, %I:%M %p")
             return redirect("/dashboard")
@@ -74,27 +553,35 @@ def login():
 @app.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
-        name = request.form["name"]
-        username = request.form["username"].lower().strip()
-        pin = request.form["pin"]
-        customers = load_data()
+        form = request.form
+        name = form["name"]
+        username = form["username"].strip().lower()
+        pin = form["pin"]
 
-        if username in customers:
-            return render_template("register.html", error="Username taken")
-        
-        customers[username] = {
-            "pin": pin,
-            "name": name,
-            "account_no": str(random.randint(2000000000, 2999999999)), # Realistic Acc No
-            "account_type": "Savings",
-            "tier": "Tier 1",
-            "daily_used": 0,
-            "last_txn_date": datetime.now().strftime("%Y-%m-%d"),
-            "balance": 0,
-            "status": "Active",
-            "transactions": []
-        }
-        save_data(customers)
+        if not USERNAME_RE.fullmatch(username):
+            return render_template("register.html", error="Username must be 3-30 letters, digits, dots or underscores")
+
+        # Hash outside the lock; it is deliberately slow
+        pin_hash = generate_password_hash(pin)
+
+        with _DB_LOCK:
+            if username in load_data():
+                return render_template("register.html", error="Username taken")
+            
+            record("register", {username: {
+                "pin": pin_hash,
+                "name": name,
+                "account_no": generate_account_no(),
+                "account_type": "Savings",
+                "tier": "Tier 1",
+                "daily_used": 0,
+                "last_txn_date": today(),
+                "balance": 0,
+                "status": "Active",
+                "total_in": 0,
+                "total_out": 0,
+                "transactions": []
+            }})
         return redirect("/")
     return render_template("register.html")
 
@@ -102,59 +589,54 @@ def register():
 def dashboard():
     if "user" not in session: return redirect("/")
     
-    customers = load_data()
-    user = customers.get(session["user"])
+    user = load_user(session["user"])
     
     if not user:
         session.clear()
         return redirect("/")
 
     # Calculate Limits
-    tier = user.get("tier", "Tier 1")
-    limit = TIER_LIMITS.get(tier, 9000000)
+    limit = tier_limit(user)
     daily_used = user.get("daily_used", 0)
     
-    if user.get("last_txn_date") != datetime.now().strftime("%Y-%m-%d"):
+    if user.get("last_txn_date") != today():
         daily_used = 0
 
-    progress = min((daily_used / limit) * 100, 100) if limit > 0 else 0
+    progress = compute_progress(daily_used, limit)
 
-    return render_template("dashboard.html", user=user, limit=limit, daily_used=daily_used, progress=progress)
+    recent = user["transactions"][:-6:-1]
+
+    return render_template("dashboard.html", user=user, recent=recent, limit=limit, daily_used=daily_used, progress=progress)
 
 @app.route("/transactions")
+@cached_page
 def transactions():
     if "user" not in session: return redirect("/")
-    customers = load_data()
-    user = customers.get(session["user"])
+    user = load_user(session["user"])
     if not user: return redirect("/")
-    return render_template("transactions.html", user=user, transactions=user.get("transactions", []))
+    return render_template("transactions.html", user=user, transactions=reversed(user.get("transactions", [])))
 
 @app.route("/cards")
+@cached_page
 def cards():
     if "user" not in session: return redirect("/")
-    customers = load_data()
-    user = customers.get(session["user"])
+    user = load_user(session["user"])
     if not user: return redirect("/")
     return render_template("cards.html", user=user)
 
 @app.route("/analytics")
+@cached_page
 def analytics():
     if "user" not in session: return redirect("/")
-    customers = load_data()
-    user = customers.get(session["user"])
+    user = load_user(session["user"])
     if not user: return redirect("/")
 
-    txns = user.get("transactions", [])
-    total_in = sum(t["amount"] for t in txns if t["type"] == "Credit")
-    total_out = sum(t["amount"] for t in txns if t["type"] == "Debit")
-
-    return render_template("analytics.html", user=user, total_in=total_in, total_out=total_out)
+    return render_template("analytics.html", user=user, total_in=user["total_in"], total_out=user["total_out"])
 
 @app.route("/settings")
 def settings():
     if "user" not in session: return redirect("/")
-    customers = load_data()
-    user = customers.get(session["user"])
+    user = load_user(session["user"])
     if not user: return redirect("/")
     return render_template("settings.html", user=user)
 
@@ -164,49 +646,44 @@ def settings():
 def upgrade_tier():
     if "user" not in session: return redirect("/")
     
-    customers = load_data()
-    user = customers.get(session["user"])
+    user = load_user(session["user"])
     
     if not user: return redirect("/")
 
-    current_tier = user.get("tier", "Tier 1")
-    
-    if current_tier == "Tier 1":
-        user["tier"] = "Tier 2"
-        flash("🎉 Upgraded to Tier 2! Daily Limit: ₦9,000,000,000", "success")
-    elif current_tier == "Tier 2":
-        user["tier"] = "Tier 3"
-        flash("🚀 Upgraded to Tier 3! Daily Limit: ₦9,000,000,000,000", "success")
-    else:
-        flash("You are already on the highest tier (Tier 3).", "info")
+    with _DB_LOCK:
+        current_tier = user.get("tier", "Tier 1")
+        
+        if current_tier == "Tier 1":
+            record("upgrade_tier", {session["user"]: {"tier": "Tier 2"}})
+            flash("🎉 Upgraded to Tier 2! Daily Limit: ₦9,000,000,000", "success")
+        elif current_tier == "Tier 2":
+            record("upgrade_tier", {session["user"]: {"tier": "Tier 3"}})
+            flash("🚀 Upgraded to Tier 3! Daily Limit: ₦9,000,000,000,000", "success")
+        else:
+            flash("You are already on the highest tier (Tier 3).", "info")
         
-    save_data(customers)
     return redirect("/settings")
 
 @app.route("/deposit", methods=["POST"])
 def deposit():
     if "user" not in session: return redirect("/")
     try:
-        amount = int(request.form["amount"])
-    except ValueError: return redirect("/dashboard")
+        amount = parse_amount(request.form["amount"], int)
+    except ValueError:
+        flash("Invalid amount entered", "error")
+        return redirect("/dashboard")
 
-    customers = load_data()
-    user = customers.get(session["user"])
+    user = load_user(session["user"])
     
     if not user: return redirect("/")
 
     if amount > 0:
-        user["balance"] += amount
-        txn = {
-            "date": datetime.now().strftime('%d-%m-%Y %H:%M'),
-            "desc": "Cash Deposit",
-            "type": "Credit",
-            "amount": amount,
-            "ref": generate_ref(),
-            "status": "Success"
-        }
-        user["transactions"].insert(0, txn)
-        save_data(customers)
+        with _DB_LOCK:
+            if user["balance"] + amount >= AMOUNT_LIMIT:
+                flash("Invalid amount entered", "error")
+                return redirect("/dashboard")
+            txn = make_txn("Cash Deposit", "Credit", amount, generate_ref(session["user"]))
+            record("deposit", {session["user"]: {"balance": user["balance"] + amount, "txn": txn}})
 
     return redirect("/dashboard")
 
@@ -215,33 +692,24 @@ def withdraw():
     if "user" not in session: return redirect("/")
     
     try:
-        amount = float(request.form["amount"])
+        amount = parse_amount(request.form["amount"])
     except ValueError:
         flash("Invalid amount entered", "error")
         return redirect("/dashboard")
 
-    customers = load_data()
-    user = customers.get(session["user"])
+    user = load_user(session["user"])
     
     if not user: return redirect("/")
 
-    if amount > user["balance"]:
-        flash("Insufficient funds! You cannot withdraw more than you have.", "error")
-        return redirect("/dashboard")
+    with _DB_LOCK:
+        if amount > user["balance"]:
+            flash("Insufficient funds! You cannot withdraw more than you have.", "error")
+            return redirect("/dashboard")
 
-    if amount > 0:
-        user["balance"] -= amount
-        txn = {
-            "date": datetime.now().strftime('%d-%m-%Y %H:%M'),
-            "desc": "Cash Withdrawal",
-            "type": "Debit",
-            "amount": amount,
-            "ref": generate_ref(),
-            "status": "Success"
-        }
-        user["transactions"].insert(0, txn)
-        save_data(customers)
-        flash(f"Withdrawal of ₦{amount:,.2f} successful!", "success")
+        if amount > 0:
+            txn = make_txn("Cash Withdrawal", "Debit", amount, generate_ref(session["user"]))
+            record("withdraw", {session["user"]: {"balance": user["balance"] - amount, "txn": txn}})
+            flash(f"Withdrawal of ₦{amount:,.2f} successful!", "success")
 
     return redirect("/dashboard")
 
@@ -249,65 +717,52 @@ def withdraw():
 def transfer():
     if "user" not in session: return redirect("/")
     
+    form = request.form
     try:
-        amount = float(request.form["amount"])
-        recipient_acc = request.form["account_number"].strip()
+        amount = parse_amount(form["amount"])
+        recipient_acc = form["account_number"].strip()
     except ValueError: return redirect("/dashboard")
 
-    customers = load_data()
     sender_username = session["user"]
-    sender = customers.get(sender_username)
+    sender = load_user(sender_username)
     
     if not sender:
         session.clear()
         return redirect("/")
 
-    allowed, limit = check_daily_limit(sender, amount)
-    if not allowed or sender["balance"] < amount:
-        flash("Insufficient funds or daily limit exceeded!", "error") 
-        return redirect("/dashboard") 
-
-    recipient = None
-    recipient_username = None
-    
-    for uname, data in customers.items():
-        if data["account_no"] == recipient_acc:
-            recipient = data
-            recipient_username = uname
-            break
-    
-    if not recipient:
-        flash("Recipient account not found!", "error") 
-        return redirect("/dashboard") 
-    
-    if recipient_username == sender_username:
-        flash("You cannot transfer money to yourself!", "error") 
-        return redirect("/dashboard") 
-
-    ref = generate_ref()
-    sender["balance"] -= amount
-    sender["daily_used"] += amount
-    recipient["balance"] += amount
-
-    sender["transactions"].insert(0, {
-        "date": datetime.now().strftime('%d-%m-%Y %H:%M'),
-        "desc": f"Transfer to {recipient['name']}",
-        "type": "Debit", 
-        "amount": amount, 
-        "ref": ref, 
-        "status": "Success"
-    })
-
-    recipient["transactions"].insert(0, {
-        "date": datetime.now().strftime('%d-%m-%Y %H:%M'),
-        "desc": f"Received from {sender['name']}",
-        "type": "Credit", 
-        "amount": amount, 
-        "ref": ref, 
-        "status": "Success"
-    })
+    # Checks and updates happen under one lock so concurrent transfers
+    # cannot both spend the same balance
+    with _DB_LOCK:
+        allowed, limit = check_daily_limit(sender, amount)
+        if not allowed or sender["balance"] < amount:
+            flash("Insufficient funds or daily limit exceeded!", "error") 
+            return redirect("/dashboard") 
 
-    save_data(customers)
+        recipient_username, recipient = find_account(recipient_acc)
+        
+        if not recipient:
+            flash("Recipient account not found!", "error") 
+            return redirect("/dashboard") 
+        
+        if recipient_username == sender_username:
+            flash("You cannot transfer money to yourself!", "error") 
+            return redirect("/dashboard") 
+
+        ref = generate_ref(sender_username, recipient_username)
+
+        # Both sides go into one log entry so a transfer is never half applied
+        record("transfer", {
+            sender_username: {
+                "balance": sender["balance"] - amount,
+                "daily_used": sender["daily_used"] + amount,
+                "last_txn_date": sender["last_txn_date"],
+                "txn": make_txn(f"Transfer to {recipient['name']}", "Debit", amount, ref)
+            },
+            recipient_username: {
+                "balance": recipient["balance"] + amount,
+                "txn": make_txn(f"Received from {sender['name']}", "Credit", amount, ref)
+            }
+        })
     return redirect(f"/receipt/{ref}")
 
 # --- UPDATED PAY BILLS FUNCTION ---
@@ -315,72 +770,47 @@ def transfer():
 def pay_bills():
     if "user" not in session: return redirect("/")
     
-    customers = load_data()
-    user = customers.get(session["user"])
+    user = load_user(session["user"])
     
     if not user:
         session.clear()
         return redirect("/")
 
+    form = request.form
     try:
-        amount = float(request.form["amount"])
-        bill_type = request.form["bill_type"]
+        amount = parse_amount(form["amount"])
+        bill_type = form["bill_type"]
     except ValueError:
         flash("Invalid amount entered", "error")
         return redirect("/dashboard")
 
-    if user["balance"] < amount:
-        flash("Insufficient funds for bill payment!", "error")
-        return redirect("/dashboard")
-
-    desc = f"Bill: {bill_type}"
-    
     # Capture Dynamic Fields based on Type
-    if bill_type in ["Airtime", "Data"]:
-        network = request.form.get("network", "Mobile")
-        phone = request.form.get("phone_number", "")
-        desc = f"{bill_type}: {network} {phone}"
-        
-    elif bill_type == "Electricity":
-        disco = request.form.get("disco", "Power")
-        meter = request.form.get("meter_number", "")
-        desc = f"Power: {disco} ({meter})"
-        
-    elif bill_type == "Cable":
-        provider = request.form.get("cable_provider", "Cable")
-        iuc = request.form.get("smartcard", "")
-        desc = f"Cable: {provider} ({iuc})"
-
-    elif bill_type == "Betting":
-        platform = request.form.get("bet_platform", "Bet")
-        userid = request.form.get("bet_id", "")
-        desc = f"Betting: {platform} ({userid})"
-
-    user["balance"] -= amount
-    ref = generate_ref()
-    
-    txn = {
-        "date": datetime.now().strftime('%d-%m-%Y %H:%M'),
-        "desc": desc,
-        "type": "Debit", 
-        "amount": amount, 
-        "ref": ref, 
-        "status": "Success"
-    }
-    
-    user["transactions"].insert(0, txn)
-    save_data(customers)
+    spec = BILL_FIELDS.get(bill_type)
+    if spec:
+        provider_field, provider_default, number_field, template = spec
+        desc = template.format(form.get(provider_field, provider_default), form.get(number_field, ""))
+    else:
+        desc = f"Bill: {bill_type}"
+
+    with _DB_LOCK:
+        if user["balance"] < amount:
+            flash("Insufficient funds for bill payment!", "error")
+            return redirect("/dashboard")
+
+        ref = generate_ref(session["user"])
+        txn = make_txn(desc, "Debit", amount, ref)
+        record("pay_bills", {session["user"]: {"balance": user["balance"] - amount, "txn": txn}})
     
     return redirect(f"/receipt/{ref}")
 
 @app.route("/receipt/<ref>")
+@cached_page
 def receipt(ref):
     if "user" not in session: return redirect("/")
-    customers = load_data()
-    user = customers.get(session["user"])
+    user = load_user(session["user"])
     if not user: return redirect("/")
     
-    txn = next((t for t in user["transactions"] if t["ref"] == ref), None)
+    txn = find_transaction(session["user"], ref)
     if not txn: return redirect("/dashboard")
     
     return render_template("receipt.html", t=txn, user=user)
@@ -389,16 +819,10 @@ def receipt(ref):
 def resolve_account():
     data = request.get_json()
     account_no = data.get("account_number", "").strip()
-    customers = load_data()
-    
-    found_name = None
-    for user_data in customers.values():
-        if user_data.get("account_no") == account_no:
-            found_name = user_data["name"]
-            break
+    _, user = find_account(account_no)
             
-    if found_name:
-        return jsonify({"status": "success", "account_name": found_name})
+    if user:
+        return jsonify({"status": "success", "account_name": user["name"]})
     else:
         return jsonify({"status": "error", "message": "Account not found"})
 
@@ -407,5 +831,12 @@ def logout():
     session.clear()
     return redirect("/")
 
+# --- CLI COMMANDS ---
+
+@app.cli.command("dump-db")
+def dump_db():
+    """Prints the database in a human readable form."""
+    print(orjson.dumps(load_data(read_only=True), option=orjson.OPT_INDENT_2).decode())
+
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    app.run(debug=os.environ.get("FLASK_DEBUG") == "1", host='0.0.0.0', port=5000)
\ No newline at end of file